@@ -1,86 +1,189 @@
+import importlib.util
 import os
-import shutil
+import sys
+from types import ModuleType
 
 # These names must stay in sync with CORE_LOCAL_FILENAME and CORE_STAGED_FILENAME in azul_core.py
 CORE_LOCAL_FILENAME = "azul_core.cp311-win_amd64.pyd"
 CORE_STAGED_FILENAME = "azul_core_new.cp311-win_amd64.pyd"
 
+# Set to "1" before azul_core is imported so its module init can skip building the Tk GUI.
+# The current core does not read it yet, so it has no effect on startup there.
+HEADLESS_ENV_VAR = "AZUL_HEADLESS"
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+_CORE_MAIN_PATH = os.path.join(_BASE_DIR, CORE_LOCAL_FILENAME)
+_CORE_NEW_PATH = os.path.join(_BASE_DIR, CORE_STAGED_FILENAME)
+_CORE_BACKUP_PATH = _CORE_MAIN_PATH + ".bak"
+_LAUNCHER_BACKUP_PATH = os.path.join(_BASE_DIR, "AZUL.py.bak")
+
+# Launcher messages are collected here and written to the console in one go
+_log: list[str] = []
+
+
+def _flush_log() -> None:
+    # sys.stderr is None under pythonw.exe; drop the messages like print() would
+    if _log and sys.stderr is not None:
+        sys.stderr.write("\n".join(_log) + "\n")
+    _log.clear()
+
+
+def _atomic_swap(src: str, dst: str) -> None:
+    """Replace `dst` with `src`, flushing the rename to disk before returning on Windows."""
+    if os.name == "nt":
+        import ctypes
+
+        MOVEFILE_REPLACE_EXISTING = 0x1
+        MOVEFILE_WRITE_THROUGH = 0x8
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        if kernel32.MoveFileExW(src, dst, MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH):
+            return
+    os.replace(src, dst)
 
-def _finalize_core_update() -> None:
-    """If an updated core has been staged, swap it in before importing azul_core."""
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    core_new = os.path.join(base_dir, CORE_STAGED_FILENAME)
-    core_main = os.path.join(base_dir, CORE_LOCAL_FILENAME)
 
-    if not os.path.exists(core_new):
+def _backup_core(core_main: str, backup: str) -> None:
+    """Save the existing core as `backup`, avoiding a byte-for-byte copy where possible."""
+    try:
+        # A hard link leaves the current core in place until the staged one replaces it
+        os.link(core_main, backup)
+        return
+    except FileNotFoundError:
+        # No current core to back up, the other fallbacks would fail the same way
+        raise
+    except FileExistsError:
+        pass
+    except OSError:
+        # Hard links unsupported here, so move or copy the core aside instead
+        try:
+            os.replace(core_main, backup)
+        except OSError:
+            import shutil
+
+            shutil.copy2(core_main, backup)
         return
+    # Drop the backup left by an earlier update and link again, keeping the live core in place
+    os.remove(backup)
+    os.link(core_main, backup)
+
 
+def _finalize_core_update() -> None:
+    """Swap the staged core in before importing azul_core; main() checks that one is staged."""
     try:
         # Back up existing core if present
-        if os.path.exists(core_main):
-            backup = core_main + ".bak"
-            try:
-                shutil.copy2(core_main, backup)
-                print("[Azul] Backup of existing core saved as", backup)
-            except Exception as e:
-                print("[Azul] Warning: could not back up existing core:", e)
-            try:
-                os.remove(core_main)
-            except Exception:
-                # If we can't remove, still try to replace
-                pass
+        try:
+            _backup_core(_CORE_MAIN_PATH, _CORE_BACKUP_PATH)
+            _log.append(f"[Azul] Backup of existing core saved as {_CORE_BACKUP_PATH}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            _log.append(f"[Azul] Warning: could not back up existing core: {e}")
 
         # Swap staged core into place
-        os.replace(core_new, core_main)
-        print("[Azul] Swapped in updated core from", CORE_STAGED_FILENAME)
+        _atomic_swap(_CORE_NEW_PATH, _CORE_MAIN_PATH)
+        _log.append(f"[Azul] Swapped in updated core from {CORE_STAGED_FILENAME}")
 
         # Optional cleanup: remove launcher backup if present
-        launcher_backup = os.path.join(base_dir, "AZUL.py.bak")
-        if os.path.exists(launcher_backup):
-            try:
-                os.remove(launcher_backup)
-            except Exception as e:
-                print("[Azul] Warning: could not remove launcher backup:", e)
-    except Exception as e:
-        print("[Azul] Failed to finalize core update:", e)
+        try:
+            os.remove(_LAUNCHER_BACKUP_PATH)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            _log.append(f"[Azul] Warning: could not remove launcher backup: {e}")
+    except OSError as e:
+        _log.append(f"[Azul] Failed to finalize core update: {e}")
 
 
-def main() -> None:
-    # Handle any staged core update first
-    _finalize_core_update()
+def _prefault_core() -> None:
+    """Read the core .pyd once sequentially so the loader's page faults hit the file cache."""
+    if os.environ.get("AZUL_SKIP_PREFAULT") == "1":
+        return
+    try:
+        with open(_CORE_MAIN_PATH, "rb", buffering=0) as f:
+            f.read()
+    except OSError:
+        pass
+
+
+def _import_core() -> ModuleType:
+    """Import azul_core straight from the launcher directory instead of searching sys.path."""
+    spec = importlib.util.spec_from_file_location("azul_core", _CORE_MAIN_PATH)
+    if spec is None or spec.loader is None or not os.path.isfile(_CORE_MAIN_PATH):
+        # No core next to the launcher, fall back to the regular search
+        return importlib.import_module("azul_core")
+    try:
+        # A single-phase extension runs its whole module body here, in create_module
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["azul_core"] = module
+        spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop("azul_core", None)
+        raise
+    return module
+
+
+def _headless_requested() -> bool:
+    """Whether this launch asked for headless mode via `--headless` or the environment."""
+    return "--headless" in sys.argv[1:] or os.environ.get(HEADLESS_ENV_VAR) == "1"
+
+
+def _run() -> None:
+    headless_requested = _headless_requested()
+    if headless_requested:
+        # Let azul_core see the request during import, before it builds any GUI
+        os.environ[HEADLESS_ENV_VAR] = "1"
+
+    # Handle any staged core update first (nearly every launch has none)
+    if os.path.lexists(_CORE_NEW_PATH):
+        _finalize_core_update()
+        # Flush now in case the freshly swapped core fails hard on import
+        _flush_log()
 
     # Load controller injection first so its patches/hooks are active
     try:
         import controller_injection_VC_ENUM_PATCH  # noqa: F401
-    except Exception as e:
-        print("[Azul] Warning: controller injection module failed to load:", e)
+    except ImportError as e:
+        _log.append(f"[Azul] Warning: controller injection module failed to load: {e}")
+    # Flush before the core's import, which can prompt for input or exit the process
+    _flush_log()
 
     # Then load the main core (compiled .pyd) and start it
+    _prefault_core()
     try:
-        import azul_core  # noqa: F401
-    except Exception as e:
-        print("[Azul] Failed to import azul_core module:", e)
+        azul_core = _import_core()
+    except ImportError as e:
+        _log.append(f"[Azul] Failed to import azul_core module: {e}")
         return
 
+    core_ns = azul_core.__dict__
+    # Dispatch follows the core's own flag; it does its headless setup only when that is set
+    headless = core_ns.get("HEADLESS_SERVER", False)
+
     # Replicate the entrypoint logic that lived under `if __name__ == "__main__"`
     try:
-        headless = getattr(azul_core, "HEADLESS_SERVER", False)
         if headless:
             # Prefer the web/localhost server entrypoint if it exists
-            run_server = getattr(azul_core, "run_localhost_server", None)
+            run_server = core_ns.get("run_localhost_server")
             if callable(run_server):
                 run_server()
                 return
 
         # Fallback to Tk GUI mainloop if available
-        app = getattr(azul_core, "app", None)
+        app = core_ns.get("app")
         if app is not None and hasattr(app, "mainloop"):
             app.mainloop()
         else:
             # As a last resort, just keep the process alive so background threads can run
-            print("[Azul] Warning: no explicit entrypoint found in azul_core (run_localhost_server/app).")
+            _log.append("[Azul] Warning: no explicit entrypoint found in azul_core (run_localhost_server/app).")
     except Exception as e:
-        print("[Azul] Error while starting AZUL core:", e)
+        _log.append(f"[Azul] Error while starting AZUL core: {e}")
+
+
+def main() -> None:
+    try:
+        _run()
+    finally:
+        # Nothing buffered may be lost, even if the core's init raises out of _run()
+        _flush_log()
 
 
 if __name__ == "__main__":